@@ -1,37 +1,198 @@
 import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib.colors import LinearSegmentedColormap, to_rgb
+from matplotlib.colors import LinearSegmentedColormap, ListedColormap, to_rgb
 from matplotlib import animation
-from numba import njit
+from numba import njit, prange, get_num_threads, get_thread_id, config
+from fast_histogram import histogram2d as fh2d
+from math import sin, cos, log1p
+import subprocess
 import time
 
-@njit
-def clifford_fast(n_points, a, b, c, d, n_iter):
-    """Fast Clifford attractor computation."""
-    # Use random initial points for faster computation
-    x = np.random.uniform(-0.5, 0.5, n_points)
-    y = np.random.uniform(-0.5, 0.5, n_points)
+try:
+    import cupy as cp
+except ImportError:  # GPU rendering is optional
+    cp = None
+
+def clifford_colormap(name="clifford"):
+    """Beautiful colormap, sampled once into a 256-entry lookup table."""
+    colors = ['#000033', '#0066CC', '#00FFFF', '#FFFF00', '#FF6600', '#FF0033']
+    smooth = LinearSegmentedColormap.from_list(name, [to_rgb(c) for c in colors])
+    return ListedColormap(smooth(np.linspace(0, 1, 256)), name=name)
+
+def initial_points(n_points, seed=42):
+    """Random float32 starting points in [-0.5, 0.5), drawn once with PCG64."""
+    rng = np.random.default_rng(seed)
+    x0 = rng.uniform(-0.5, 0.5, n_points).astype(np.float32)
+    y0 = rng.uniform(-0.5, 0.5, n_points).astype(np.float32)
+    return x0, y0
+
+@njit(parallel=True, fastmath=True, error_model='numpy', cache=True)
+def clifford_fast(x0, y0, a, b, c, d, n_iter, keep_last=20):
+    """Fast Clifford attractor computation, keeping the last keep_last steps."""
+    # Match the float32 starting points
+    a, b = np.float32(a), np.float32(b)
+    c, d = np.float32(c), np.float32(d)
     
-    # Store all trajectory points
-    all_x = np.zeros(n_points * n_iter)
-    all_y = np.zeros(n_points * n_iter)
+    n_points = len(x0)
     
-    for i in range(n_iter):
-        # Clifford map equations
-        x_new = np.sin(a * y) + c * np.cos(a * x)
-        y_new = np.sin(b * x) + d * np.cos(b * y)
-        x, y = x_new, y_new
+    # Only the converged end of each trajectory is stored
+    keep_last = max(0, min(keep_last, n_iter))
+    skip = n_iter - keep_last
+    all_x = np.zeros(n_points * keep_last, np.float32)
+    all_y = np.zeros(n_points * keep_last, np.float32)
+    
+    # Points are independent, so each one is iterated on its own
+    for p in prange(n_points):
+        x = x0[p]
+        y = y0[p]
         
-        # Store points
-        start_idx = i * n_points
-        end_idx = (i + 1) * n_points
-        all_x[start_idx:end_idx] = x
-        all_y[start_idx:end_idx] = y
+        for i in range(n_iter):
+            # Clifford map equations
+            s_ay, c_ax = sin(a * y), cos(a * x)
+            s_bx, c_by = sin(b * x), cos(b * y)
+            x = s_ay + c * c_ax
+            y = s_bx + d * c_by
+            
+            # Store points
+            if i >= skip:
+                all_x[(i - skip) * n_points + p] = x
+                all_y[(i - skip) * n_points + p] = y
     
     return all_x, all_y
 
-def create_fast_clifford_video(duration_seconds=60, fps=24):
-    """Create a fast, high-quality Clifford attractor video."""
+def make_clifford_kernel(b, c, d):
+    """Build a fused Clifford density kernel with b, c, d fixed at compile time.
+    
+    Only 'a' varies between frames, so b, c, d are captured by the closure
+    and Numba compiles them in as constants.
+    """
+    # float32 is plenty for a chaotic map that ends up in a histogram
+    b, c, d = np.float32(b), np.float32(c), np.float32(d)
+    
+    # Not cached: closures can't go in Numba's cache
+    @njit(parallel=True, fastmath=True, error_model='numpy')
+    def clifford_density(x0, y0, a, n_iter, bins, xmin, xmax, out, hists, tile=1024):
+        """Log1p Clifford attractor density, written to out; returns its max.
+        
+        out is (bins, bins) float32 with y along the rows, ready for imshow.
+        hists is the zeroed per-thread scratch from density_scratch(bins);
+        it is left zeroed again on return, so it can be reused every frame.
+        """
+        n_points = len(x0)
+        
+        # One histogram per thread, so no two threads touch the same bins.
+        # Thread ids run up to the thread count at call time, not allocation
+        n_threads = get_num_threads()
+        if hists.shape[0] < n_threads:
+            raise ValueError("hists has fewer histograms than active Numba threads")
+        
+        a = np.float32(a)
+        lo, hi = np.float32(xmin), np.float32(xmax)
+        inv = np.float32(bins / (xmax - xmin))
+        
+        # Points are handed out in contiguous tiles, each run by a single thread
+        n_tiles = (n_points + tile - 1) // tile
+        for t in prange(n_tiles):
+            hist_t = hists[get_thread_id()]
+            
+            for p in range(t * tile, min((t + 1) * tile, n_points)):
+                x = x0[p]
+                y = y0[p]
+                
+                for i in range(n_iter):
+                    # Clifford map equations, one scalar libm call per term
+                    s_ay, c_ax = sin(a * y), cos(a * x)
+                    s_bx, c_by = sin(b * x), cos(b * y)
+                    x = s_ay + c * c_ax
+                    y = s_bx + d * c_by
+                    
+                    # Bin the point straight away instead of storing it; rounding
+                    # can push x just below hi to index bins, so fold it into the
+                    # last bin like np.histogram2d does
+                    if lo <= x < hi and lo <= y < hi:
+                        iy = min(int((y - lo) * inv), bins - 1)
+                        ix = min(int((x - lo) * inv), bins - 1)
+                        hist_t[iy, ix] += 1
+        
+        # Reduce the per-thread histograms, take log1p and track the max in one
+        # pass, zeroing the scratch for the next call as it is read
+        row_max = np.zeros(bins, np.float32)
+        for i in prange(bins):
+            for j in range(bins):
+                count = 0
+                for t in range(n_threads):
+                    count += hists[t, i, j]
+                    hists[t, i, j] = 0
+                v = np.float32(log1p(count))
+                out[i, j] = v
+                if v > row_max[i]:
+                    row_max[i] = v
+        
+        return row_max.max()
+    
+    return clifford_density
+
+def density_scratch(bins):
+    """Zeroed per-thread histograms for clifford_density, one per Numba thread.
+    
+    Sized for NUMBA_NUM_THREADS, the most threads set_num_threads can enable,
+    so the scratch stays valid if the thread count is raised later.
+    """
+    return np.zeros((config.NUMBA_NUM_THREADS, bins, bins), np.int32)
+
+def estimate_log_peak(clifford_density, x0, y0, a_values, n_iter, bins):
+    """Median log1p peak bin count over a sweep of 'a' values."""
+    out = np.empty((bins, bins), np.float32)
+    hists = density_scratch(bins)
+    return np.median([clifford_density(x0, y0, a, n_iter, bins, -3.0, 3.0, out, hists)
+                      for a in a_values])
+
+if cp is not None:
+    # One Clifford step for every (frame, point) pair, updating x, y in place
+    _clifford_step_gpu = cp.ElementwiseKernel(
+        'float32 a, float32 b, float32 c, float32 d', 'float32 x, float32 y',
+        '''
+        float x_new = __sinf(a * y) + c * __cosf(a * x);
+        y = __sinf(b * x) + d * __cosf(b * y);
+        x = x_new;
+        ''',
+        'clifford_step')
+
+def clifford_hist_gpu(x0, y0, a_values, b, c, d, n_iter, bins, xmin, xmax):
+    """Clifford attractor densities for a batch of 'a' values, on the GPU."""
+    n_frames = len(a_values)
+    n_points = len(x0)
+    a = cp.asarray(a_values, dtype=cp.float32)[:, None]
+    
+    # Frames are the leading axis, so each step runs over all frames at once
+    x = cp.tile(cp.asarray(x0, dtype=cp.float32), (n_frames, 1))
+    y = cp.tile(cp.asarray(y0, dtype=cp.float32), (n_frames, 1))
+    
+    all_x = cp.empty((n_frames, n_iter, n_points), cp.float32)
+    all_y = cp.empty((n_frames, n_iter, n_points), cp.float32)
+    
+    for i in range(n_iter):
+        _clifford_step_gpu(a, b, c, d, x, y)
+        all_x[:, i] = x
+        all_y[:, i] = y
+    
+    hists = cp.empty((n_frames, bins, bins), cp.int32)
+    for f in range(n_frames):
+        hists[f] = cp.histogram2d(all_x[f].ravel(), all_y[f].ravel(), bins=bins,
+                                  range=[[xmin, xmax], [xmin, xmax]])[0]
+    
+    # Only the histograms go back to the host
+    return cp.asnumpy(hists)
+
+def create_fast_clifford_video(duration_seconds=60, fps=24, use_gpu=False):
+    """Create a fast, high-quality Clifford attractor video.
+    
+    use_gpu=True computes the histograms with CuPy instead of Numba. That
+    path is untested: it has not yet been run on a CUDA device.
+    """
+    
+    if use_gpu and cp is None:
+        raise ImportError("use_gpu=True requires CuPy")
     
     total_frames = duration_seconds * fps
     print(f"Creating {duration_seconds}s video at {fps} FPS = {total_frames} frames")
@@ -48,19 +209,58 @@ def create_fast_clifford_video(duration_seconds=60, fps=24):
     # Fixed parameters
     b, c, d = 1.6, 1.0, 0.7
     
+    # Same starting points for every frame
+    x0, y0 = initial_points(n_points)
+    
+    # One colour scale for every frame avoids flicker. The median of a sparse
+    # sweep rather than its max: where the orbit collapses into a few bins
+    # the peak jumps, and those frames are simply clipped at the top colour.
+    # The sweep runs on the same device that renders the frames.
+    if use_gpu:
+        peaks = clifford_hist_gpu(x0, y0, a_values[::30], b, c, d, n_iter, bins,
+                                  -3.0, 3.0).max(axis=(1, 2))
+        vmax = np.median(np.log1p(peaks))
+    else:
+        clifford_density = make_clifford_kernel(b, c, d)
+        hists = density_scratch(bins)
+        vmax = estimate_log_peak(clifford_density, x0, y0, a_values[::30], n_iter, bins)
+    
     # Beautiful colormap
-    colors = ['#000033', '#0066CC', '#00FFFF', '#FFFF00', '#FF6600', '#FF0033']
-    cmap = LinearSegmentedColormap.from_list("clifford", [to_rgb(c) for c in colors])
+    cmap = clifford_colormap()
     
     # Set up figure
     fig, ax = plt.subplots(figsize=(10, 10))
     fig.patch.set_facecolor('black')
     fig.subplots_adjust(left=0, right=1, bottom=0, top=1)
+    ax.set_facecolor('black')
+    
+    # Create the artists once, animate only updates them
+    im = ax.imshow(np.zeros((bins, bins), np.float32), origin='lower', 
+                  extent=[-3, 3, -3, 3], cmap=cmap, vmin=0, vmax=vmax)
+    
+    # Remove axes
+    ax.set_xticks([])
+    ax.set_yticks([])
+    
+    # Add title and info
+    ax.text(0.5, 0.95, 'Clifford Attractor Evolution', 
+           transform=ax.transAxes, ha='center', va='top',
+           fontsize=16, color='white', weight='bold')
+    
+    param_text = ax.text(0.02, 0.02, '', 
+                        transform=ax.transAxes, va='bottom',
+                        fontsize=12, color='white',
+                        bbox=dict(boxstyle='round', facecolor='black', alpha=0.7))
+    
+    # GPU histograms are computed one second of video at a time
+    gpu_batch = fps
+    gpu_hists = {}
+    
+    # log1p target reused by every frame. This only saves the log1p
+    # temporary: im.set_data still copies the array on each frame
+    log_buf = np.empty((bins, bins), np.float32)
     
     def animate(frame):
-        ax.clear()
-        ax.set_facecolor('black')
-        
         # Current parameter value
         a = a_values[frame]
         
@@ -68,33 +268,23 @@ def create_fast_clifford_video(duration_seconds=60, fps=24):
         if frame % fps == 0:  # Every second
             print(f"Frame {frame+1}/{total_frames} ({frame/fps:.1f}s) - a={a:.3f}")
         
-        # Compute attractor
-        x_points, y_points = clifford_fast(n_points, a, b, c, d, n_iter)
+        # Compute attractor density
+        if use_gpu:
+            start = frame - frame % gpu_batch
+            if start not in gpu_hists:
+                gpu_hists.clear()
+                gpu_hists[start] = clifford_hist_gpu(x0, y0, a_values[start:start + gpu_batch],
+                                                     b, c, d, n_iter, bins, -3.0, 3.0)
+            np.log1p(gpu_hists[start][frame - start].T, out=log_buf)
+        else:
+            clifford_density(x0, y0, a, n_iter, bins, -3.0, 3.0, log_buf, hists)
         
-        # Create density plot
-        hist, xedges, yedges = np.histogram2d(x_points, y_points, bins=bins, 
-                                            range=[[-3, 3], [-3, 3]])
+        # Update image, already log scaled
+        im.set_data(log_buf)
         
-        # Plot with logarithmic scaling
-        im = ax.imshow(np.log1p(hist.T), origin='lower', 
-                      extent=[-3, 3, -3, 3], cmap=cmap, 
-                      vmin=0, vmax=np.log1p(hist.max()))
+        param_text.set_text(f'a = {a:.3f}\nb = {b:.1f}\nc = {c:.1f}\nd = {d:.1f}')
         
-        # Remove axes
-        ax.set_xticks([])
-        ax.set_yticks([])
-        
-        # Add title and info
-        ax.text(0.5, 0.95, 'Clifford Attractor Evolution', 
-               transform=ax.transAxes, ha='center', va='top',
-               fontsize=16, color='white', weight='bold')
-        
-        ax.text(0.02, 0.02, f'a = {a:.3f}\nb = {b:.1f}\nc = {c:.1f}\nd = {d:.1f}', 
-               transform=ax.transAxes, va='bottom',
-               fontsize=12, color='white',
-               bbox=dict(boxstyle='round', facecolor='black', alpha=0.7))
-        
-        return [im]
+        return [im, param_text]
     
     print("Starting video generation...")
     start_time = time.time()
@@ -103,9 +293,6 @@ def create_fast_clifford_video(duration_seconds=60, fps=24):
     anim = animation.FuncAnimation(fig, animate, frames=total_frames, 
                                  interval=1000/fps, blit=True)
     
-    # Show a preview
-    plt.show()
-    
     # Save video
     filename = f'clifford_evolution_{duration_seconds}s_{fps}fps.mp4'
     
@@ -138,23 +325,108 @@ def create_fast_clifford_video(duration_seconds=60, fps=24):
     
     return anim
 
+def create_raw_clifford_video(duration_seconds=60, fps=24):
+    """Create a Clifford attractor video by piping frames straight to ffmpeg.
+    
+    Skips matplotlib entirely: each histogram bin is one pixel, coloured
+    through a lookup table, and there is no title or parameter overlay.
+    """
+    
+    total_frames = duration_seconds * fps
+    print(f"Creating {duration_seconds}s raw video at {fps} FPS = {total_frames} frames")
+    
+    # Same parameters as create_fast_clifford_video
+    n_points = 5000     # Number of trajectory points
+    n_iter = 100        # Iterations per point
+    bins = 800          # Histogram resolution, also the frame size in pixels
+    
+    t = np.linspace(0, 6*np.pi, total_frames)  # 3 full cycles
+    a_values = -1.4 + 0.8 * np.sin(t)  # Varies from -2.2 to -0.6
+    b, c, d = 1.6, 1.0, 0.7
+    clifford_density = make_clifford_kernel(b, c, d)
+    
+    # Same starting points for every frame
+    x0, y0 = initial_points(n_points)
+    
+    # One colour scale for every frame, see create_fast_clifford_video
+    vmax = estimate_log_peak(clifford_density, x0, y0, a_values[::30], n_iter, bins)
+    
+    # Colormap as a lookup table from uint8 level to RGB
+    lut = (clifford_colormap()(np.arange(256))[:, :3] * 255).astype(np.uint8)
+    
+    # Scratch buffers reused by every frame
+    log_buf = np.empty((bins, bins), np.float32)
+    hists = density_scratch(bins)
+    level_buf = np.empty((bins, bins), np.uint8)
+    rgb_buf = np.empty((bins, bins, 3), np.uint8)
+    
+    filename = f'clifford_evolution_{duration_seconds}s_{fps}fps_raw.mp4'
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error',
+           '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{bins}x{bins}', '-r', str(fps),
+           '-i', '-', '-c:v', 'libx264', '-b:v', '6M', '-pix_fmt', 'yuv420p', filename]
+    
+    print(f"Saving video: {filename}")
+    start_time = time.time()
+    
+    try:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    except FileNotFoundError:
+        print("❌ Error: ffmpeg not found")
+        return None
+    
+    try:
+        for frame, a in enumerate(a_values):
+            # Progress indicator
+            if frame % fps == 0:  # Every second
+                print(f"Frame {frame+1}/{total_frames} ({frame/fps:.1f}s) - a={a:.3f}")
+            
+            clifford_density(x0, y0, a, n_iter, bins, -3.0, 3.0, log_buf, hists)
+            
+            log_buf *= 255 / vmax
+            np.minimum(log_buf, 255, out=log_buf)
+            np.copyto(level_buf, log_buf, casting='unsafe')
+            
+            # Rows flipped so y points up, like imshow(origin='lower')
+            np.take(lut, level_buf[::-1], axis=0, out=rgb_buf)
+            proc.stdin.write(rgb_buf)
+    except BrokenPipeError:
+        pass  # ffmpeg quit early, its exit code is reported below
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        proc.wait()
+    
+    if proc.returncode != 0:
+        print(f"❌ Error: ffmpeg exited with code {proc.returncode}")
+        return None
+    
+    elapsed = time.time() - start_time
+    print(f"\n✅ SUCCESS!")
+    print(f"📁 Video saved: {filename}")
+    print(f"⏱️  Total time: {elapsed/60:.1f} minutes")
+    
+    return filename
+
 # Quick test function
 def test_single_frame():
     """Test with a single frame to verify everything works."""
     print("Testing single frame...")
     
     # Compute one frame
-    x_points, y_points = clifford_fast(5000, -1.4, 1.6, 1.0, 0.7, 100)
+    x0, y0 = initial_points(5000)
+    # Bin every step, like the video kernel does
+    x_points, y_points = clifford_fast(x0, y0, -1.4, 1.6, 1.0, 0.7, 100, keep_last=100)
     
     # Plot
     fig, ax = plt.subplots(figsize=(10, 10))
     fig.patch.set_facecolor('black')
     ax.set_facecolor('black')
     
-    hist, _, _ = np.histogram2d(x_points, y_points, bins=800, range=[[-3, 3], [-3, 3]])
+    hist = fh2d(x_points, y_points, range=[[-3, 3], [-3, 3]], bins=800)
     
-    colors = ['#000033', '#0066CC', '#00FFFF', '#FFFF00', '#FF6600', '#FF0033']
-    cmap = LinearSegmentedColormap.from_list("test", [to_rgb(c) for c in colors])
+    cmap = clifford_colormap("test")
     
     ax.imshow(np.log1p(hist.T), origin='lower', extent=[-3, 3, -3, 3], cmap=cmap)
     ax.set_xticks([])
@@ -166,30 +438,27 @@ def test_single_frame():
     
     print("✅ Single frame test successful!")
 
-# Run test first
-print("🧪 Testing system...")
-test_single_frame()
-
-print("\n" + "="*60)
-print("🎬 CLIFFORD ATTRACTOR VIDEO GENERATOR")
-print("="*60)
-
-print("\nChoose your video duration:")
-print("1. Quick test (10 seconds)")  
-print("2. Short video (30 seconds)")
-print("3. Full video (60 seconds)")
-print("4. Long video (120 seconds)")
-
-print("\nUncomment one of these lines to generate:")
-print("# create_fast_clifford_video(duration_seconds=10, fps=20)   # Quick test")
-print("# create_fast_clifford_video(duration_seconds=30, fps=24)   # Short video") 
-print("# create_fast_clifford_video(duration_seconds=60, fps=24)   # 1 minute video")
-print("# create_fast_clifford_video(duration_seconds=120, fps=30)  # 2 minute video")
-
-# Uncomment ONE line below to create your video:
-
-# Quick 10-second test (recommended first)
-#create_fast_clifford_video(duration_seconds=10, fps=20)
-
-# Full 1-minute video (uncomment for final version)
-create_fast_clifford_video(duration_seconds=60, fps=24)
+if __name__ == '__main__':
+    import argparse
+    
+    ap = argparse.ArgumentParser(description="Render a Clifford attractor video.")
+    ap.add_argument('--duration', type=int, default=10, help="video length in seconds")
+    ap.add_argument('--fps', type=int, default=24, help="frames per second")
+    ap.add_argument('--test', action='store_true', help="only plot a single test frame")
+    # The raw renderer has no GPU path
+    backend = ap.add_mutually_exclusive_group()
+    backend.add_argument('--raw', action='store_true', help="pipe frames straight to ffmpeg, no overlay")
+    backend.add_argument('--gpu', action='store_true', help="compute histograms with CuPy")
+    ap.add_argument('--headless', action='store_true', help="use the Agg backend, no display")
+    args = ap.parse_args()
+    
+    if args.headless:
+        plt.switch_backend('Agg')  # Batch rendering, no display needed
+    
+    if args.test:
+        print("🧪 Testing system...")
+        test_single_frame()
+    elif args.raw:
+        create_raw_clifford_video(args.duration, args.fps)
+    else:
+        create_fast_clifford_video(args.duration, args.fps, use_gpu=args.gpu)